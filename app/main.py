@@ -12,7 +12,7 @@ This application demonstrates:
 import os
 import logging
 from flask import Flask
-from routes import register_routes
+from routes import register_routes, get_instance_id
 from s3_client import S3Client
 
 # Configure logging
@@ -32,6 +32,10 @@ def create_app():
         APP_NAME=os.getenv('APP_NAME', 'DevOps Metrics Dashboard'),
         AWS_REGION=os.getenv('AWS_REGION', 'us-east-1'),
         S3_BUCKET=os.getenv('S3_BUCKET', 'devops-metrics-bucket'),
+        S3_BATCH_SIZE=int(os.getenv('S3_BATCH_SIZE', '128')),
+        S3_FLUSH_INTERVAL=float(os.getenv('S3_FLUSH_INTERVAL', '5')),
+        S3_POOL=int(os.getenv('S3_POOL', '50')),
+        S3_MAX_BUFFERED=int(os.getenv('S3_MAX_BUFFERED', '10000')),
         ENVIRONMENT=os.getenv('ENVIRONMENT', 'development'),
         DEBUG=os.getenv('DEBUG', 'False').lower() == 'true'
     )
@@ -39,15 +43,23 @@ def create_app():
     # Initialize S3 client and attach to app context
     app.s3_client = S3Client(
         bucket_name=app.config['S3_BUCKET'],
-        region=app.config['AWS_REGION']
+        region=app.config['AWS_REGION'],
+        batch_size=app.config['S3_BATCH_SIZE'],
+        flush_interval=app.config['S3_FLUSH_INTERVAL'],
+        max_pool_connections=app.config['S3_POOL'],
+        max_buffered=app.config['S3_MAX_BUFFERED']
     )
     
     # Register all routes
     register_routes(app)
     
+    # Resolve the instance ID now so the first request doesn't wait on IMDS
+    instance_id = get_instance_id()
+    
     logger.info(f"Application initialized: {app.config['APP_NAME']}")
     logger.info(f"Environment: {app.config['ENVIRONMENT']}")
     logger.info(f"S3 Bucket: {app.config['S3_BUCKET']}")
+    logger.info(f"Instance ID: {instance_id}")
     
     return app
 
@@ -59,7 +71,9 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     
     # In production, use gunicorn instead of Flask's built-in server
-    # gunicorn -w 4 -b 0.0.0.0:5000 "main:create_app()"
+    # gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:5000 "main:create_app()"
+    # Threaded workers overlap requests blocked on S3; shared state
+    # (health cache, metric buffer, boto3 client) is thread-safe
     app.run(
         host='0.0.0.0',
         port=port,
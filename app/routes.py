@@ -5,20 +5,80 @@ Defines all HTTP endpoints for the DevOps Metrics Dashboard.
 Endpoints:
 - GET  /           : Dashboard homepage
 - GET  /health     : Health check (for ALB)
+- GET  /health/deep: Health check that queries S3 on every call
 - GET  /metrics    : Current system metrics (JSON)
 - POST /api/record : Store a new metric
 - GET  /api/metrics/<name> : Retrieve specific metrics
 """
 
 import os
+import time
+import functools
 import logging
 import platform
+import threading
+import msgspec
+import orjson
 import psutil
-from datetime import datetime
-from flask import jsonify, request, render_template, current_app
+import urllib3
+from typing import Optional
+from flask import g, has_request_context, request, render_template, current_app
+from timestamps import iso_timestamp
 
 logger = logging.getLogger(__name__)
 
+# Pre-serialized /health body, replaced wholesale by a background thread
+# that checks S3 every HEALTH_TTL_SECONDS. Swapping the reference is
+# atomic, so probes read it without taking a lock.
+_HEALTH_TTL = float(os.getenv('HEALTH_TTL_SECONDS', '15'))
+_HEALTH_BODY = {'value': None}
+_HEALTH_MONITOR = {'started': False}
+_HEALTH_MONITOR_LOCK = threading.Lock()
+
+# Reuse the last system metrics sample for rapid re-polls. cpu_percent is
+# sampled non-blocking against the previous call, so prime it once here.
+_MIN_INTERVAL = float(os.getenv('METRICS_MIN_INTERVAL', '1.0'))
+_LAST = {'ts': 0.0, 'metrics': None}
+psutil.cpu_percent(interval=None)
+
+# Disk usage changes slowly, so it is refreshed on its own, longer TTL
+_DISK_TTL = float(os.getenv('DISK_CACHE_SECONDS', '60'))
+_DISK_CACHE = {'ts': 0.0, 'value': None}
+
+# Rendered dashboard page, as (cache_key, html_bytes)
+_DASHBOARD_TTL = max(1, int(os.getenv('DASHBOARD_CACHE_SECONDS', '5')))
+_DASHBOARD_CACHE = {'value': (None, b'')}
+
+# Reused connection pool for the EC2 metadata service
+_IMDS_POOL = urllib3.PoolManager(
+    timeout=urllib3.Timeout(connect=0.2, read=0.2),
+    retries=False
+)
+
+# Values that never change while the process is running
+# Bytes to GB with two decimals via truncation: int(n * _CENTI_GB) / 100
+_GB = float(1024 ** 3)
+_CENTI_GB = 100.0 / _GB
+_CPU_COUNT = psutil.cpu_count()
+_DISK_TOTAL_GB = int(psutil.disk_usage('/').total * _CENTI_GB) / 100.0
+_MEMORY_TOTAL_GB = int(psutil.virtual_memory().total * _CENTI_GB) / 100.0
+_PLATFORM = {
+    'system': platform.system(),
+    'release': platform.release(),
+    'python_version': platform.python_version()
+}
+
+# Error bodies are serialized once; the 404 body only appends the path
+_NOT_FOUND_PREFIX = orjson.dumps({'error': 'Not found'})[:-1] + b',"path":'
+_INTERNAL_ERROR_BODY = orjson.dumps({'error': 'Internal server error'})
+
+
+class MetricIn(msgspec.Struct):
+    """Request body for POST /api/record."""
+    metric_name: str
+    value: float
+    metadata: Optional[dict] = None
+
 
 def register_routes(app):
     """Register all application routes."""
@@ -29,16 +89,25 @@ def register_routes(app):
         Main dashboard page.
         Displays current system health and recent metrics.
         """
-        # Gather system metrics for display
-        system_metrics = get_system_metrics()
+        # Serve the last render while it's within the same time bucket
+        environment = current_app.config['ENVIRONMENT']
+        key = (int(time.time()) // _DASHBOARD_TTL, environment)
+        cached_key, body = _DASHBOARD_CACHE['value']
         
-        return render_template(
-            'dashboard.html',
-            app_name=current_app.config['APP_NAME'],
-            environment=current_app.config['ENVIRONMENT'],
-            metrics=system_metrics,
-            instance_id=get_instance_id()
-        )
+        if cached_key != key:
+            # Gather system metrics for display
+            system_metrics = get_system_metrics()
+            
+            body = render_template(
+                'dashboard.html',
+                app_name=current_app.config['APP_NAME'],
+                environment=environment,
+                metrics=system_metrics,
+                instance_id=get_instance_id()
+            ).encode('utf-8')
+            _DASHBOARD_CACHE['value'] = (key, body)
+        
+        return current_app.response_class(body, mimetype='text/html')
     
     @app.route('/health')
     def health_check():
@@ -52,33 +121,23 @@ def register_routes(app):
         - Not depend on external services (DB, cache, etc.)
         
         ALB will mark instance unhealthy if this returns non-2xx.
+        Serves the body last built by the health monitor thread.
         """
-        # Basic health: app is running and can respond
-        health_status = {
-            'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'instance_id': get_instance_id(),
-            'version': os.getenv('APP_VERSION', '1.0.0')
-        }
-        
-        # Optional: Add dependency checks for deeper health verification
-        # Only do this if you want ALB to route away from instances
-        # with degraded dependencies
-        try:
-            s3_status = current_app.s3_client.check_bucket_access()
-            
-            if not s3_status.get('accessible'):
-                # Log the issue but don't fail health check
-                # S3 being unavailable shouldn't take the whole app offline
-                logger.warning(f"S3 degraded: {s3_status.get('error')}")
-                health_status['s3_status'] = 'degraded'
-            else:
-                health_status['s3_status'] = 'healthy'
-        except Exception as e:
-            logger.warning(f"S3 check failed: {e}")
-            health_status['s3_status'] = 'unknown'
-        
-        return jsonify(health_status), 200
+        body = _HEALTH_BODY['value']
+        if body is None:
+            # First probe in this process: build the body now and keep it
+            # fresh from here on
+            body = refresh_health(current_app.s3_client)
+            start_health_monitor(current_app.s3_client)
+        return json_response(body)
+    
+    @app.route('/health/deep')
+    def deep_health_check():
+        """
+        Health check that always queries S3.
+        Useful for on-demand verification; not intended for ALB probes.
+        """
+        return ojson(build_health_status(current_app.s3_client))
     
     @app.route('/metrics')
     def current_metrics():
@@ -88,8 +147,8 @@ def register_routes(app):
         """
         metrics = get_system_metrics()
         
-        return jsonify({
-            'timestamp': datetime.utcnow().isoformat(),
+        return ojson({
+            'timestamp': iso_timestamp(time.time()),
             'instance_id': get_instance_id(),
             'system': metrics
         })
@@ -107,43 +166,35 @@ def register_routes(app):
         }
         """
         if not request.is_json:
-            return jsonify({
+            return ojson({
                 'error': 'Content-Type must be application/json'
-            }), 400
-        
-        data = request.get_json()
-        
-        # Validate required fields
-        if 'metric_name' not in data:
-            return jsonify({
-                'error': 'Missing required field: metric_name'
-            }), 400
-        
-        if 'value' not in data:
-            return jsonify({
-                'error': 'Missing required field: value'
-            }), 400
+            }, 400)
         
+        # Parse and validate in one pass; strict=False keeps accepting
+        # numeric strings for "value" (booleans are rejected)
         try:
-            value = float(data['value'])
-        except (ValueError, TypeError):
-            return jsonify({
-                'error': 'Field "value" must be a number'
-            }), 400
+            data = msgspec.json.decode(request.get_data(), type=MetricIn, strict=False)
+        except msgspec.DecodeError as e:
+            return ojson({
+                'error': str(e)
+            }, 400)
         
         # Store the metric
         result = current_app.s3_client.store_metric(
-            metric_name=data['metric_name'],
-            value=value,
-            metadata=data.get('metadata')
+            metric_name=data.metric_name,
+            value=data.value,
+            metadata=data.metadata
         )
         
         if result['success']:
-            logger.info(f"Metric recorded: {data['metric_name']}={value}")
-            return jsonify(result), 201
+            logger.info(f"Metric recorded: {data.metric_name}={data.value}")
+            return ojson(result, 201)
+        elif result.get('invalid'):
+            # e.g. metadata holding ints orjson can't encode
+            return ojson(result, 400)
         else:
             logger.error(f"Failed to record metric: {result.get('error')}")
-            return jsonify(result), 500
+            return ojson(result, 500)
     
     @app.route('/api/metrics/<metric_name>')
     def get_metrics(metric_name):
@@ -154,14 +205,14 @@ def register_routes(app):
         - limit: Maximum number of results (default: 10)
         """
         limit = request.args.get('limit', 10, type=int)
-        limit = min(limit, 100)  # Cap at 100 to prevent abuse
+        limit = max(1, min(limit, 100))  # Keep within 1..100 to prevent abuse
         
         metrics = current_app.s3_client.get_recent_metrics(
             metric_name=metric_name,
             limit=limit
         )
         
-        return jsonify({
+        return ojson({
             'metric_name': metric_name,
             'count': len(metrics),
             'data': metrics
@@ -196,60 +247,152 @@ def register_routes(app):
         
         success_count = sum(1 for r in results if r['success'])
         
-        return jsonify({
+        return ojson({
             'recorded': success_count,
             'total': len(results),
             'results': results
-        }), 201 if success_count > 0 else 500
+        }, 201 if success_count > 0 else 500)
     
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({
-            'error': 'Not found',
-            'path': request.path
-        }), 404
+        body = _NOT_FOUND_PREFIX + orjson.dumps(request.path) + b'}'
+        return json_response(body, 404)
     
     @app.errorhandler(500)
     def internal_error(error):
         logger.error(f"Internal server error: {error}")
-        return jsonify({
-            'error': 'Internal server error'
-        }), 500
+        return json_response(_INTERNAL_ERROR_BODY, 500)
+
+
+def ojson(payload, status: int = 200):
+    """Serialize a payload with orjson into a JSON response."""
+    return json_response(orjson.dumps(payload), status)
+
+
+def json_response(body: bytes, status: int = 200):
+    """Wrap an already serialized JSON body in a response."""
+    return current_app.response_class(
+        body,
+        status=status,
+        mimetype='application/json'
+    )
+
+
+def build_health_status(s3_client) -> dict:
+    """Build the full health check payload, querying S3 directly."""
+    # Basic health: app is running and can respond
+    health_status = {
+        'status': 'healthy',
+        'timestamp': iso_timestamp(time.time()),
+        'instance_id': get_instance_id(),
+        'version': os.getenv('APP_VERSION', '1.0.0')
+    }
+    
+    # Optional: Add dependency checks for deeper health verification
+    # Only do this if you want ALB to route away from instances
+    # with degraded dependencies
+    health_status['s3_status'] = get_s3_status(s3_client)
+    
+    return health_status
+
+
+def get_s3_status(s3_client) -> str:
+    """Query S3 bucket access and map it to a health status string."""
+    try:
+        s3_status = s3_client.check_bucket_access()
+        
+        if not s3_status.get('accessible'):
+            # Log the issue but don't fail health check
+            # S3 being unavailable shouldn't take the whole app offline
+            logger.warning(f"S3 degraded: {s3_status.get('error')}")
+            return 'degraded'
+        return 'healthy'
+    except Exception as e:
+        logger.warning(f"S3 check failed: {e}")
+        return 'unknown'
+
+
+def refresh_health(s3_client) -> bytes:
+    """Check S3 and publish a new pre-serialized /health body."""
+    body = orjson.dumps({
+        'status': 'healthy',
+        'instance_id': get_instance_id(),
+        'version': os.getenv('APP_VERSION', '1.0.0'),
+        's3_status': get_s3_status(s3_client)
+    })
+    _HEALTH_BODY['value'] = body
+    return body
+
+
+def start_health_monitor(s3_client):
+    """
+    Refresh the /health body every HEALTH_TTL_SECONDS in a daemon thread.
+    Only the first call in a process starts the thread.
+    """
+    with _HEALTH_MONITOR_LOCK:
+        if _HEALTH_MONITOR['started']:
+            return
+        _HEALTH_MONITOR['started'] = True
+    
+    def monitor():
+        while True:
+            time.sleep(_HEALTH_TTL)
+            try:
+                refresh_health(s3_client)
+            except Exception as e:
+                logger.error(f"Error refreshing health status: {e}")
+    
+    threading.Thread(target=monitor, name='health-monitor', daemon=True).start()
 
 
 def get_system_metrics() -> dict:
+    """
+    Current system metrics, collected at most once per request.
+    """
+    if not has_request_context():
+        return collect_system_metrics()
+    
+    metrics = getattr(g, 'system_metrics', None)
+    if metrics is None:
+        metrics = collect_system_metrics()
+        g.system_metrics = metrics
+    return metrics
+
+
+def collect_system_metrics() -> dict:
     """
     Collect current system metrics using psutil.
     These metrics are what you'd typically monitor in production.
+    Samples are reused for METRICS_MIN_INTERVAL seconds.
     """
+    now = time.monotonic()
+    if _LAST['metrics'] is not None and now - _LAST['ts'] < _MIN_INTERVAL:
+        return _LAST['metrics']
+    
     try:
-        cpu_percent = psutil.cpu_percent(interval=0.1)
+        # Non-blocking: CPU usage since the previous call
+        cpu_percent = psutil.cpu_percent(interval=None)
         memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
         
-        return {
+        metrics = {
             'cpu': {
                 'percent': cpu_percent,
-                'count': psutil.cpu_count()
+                'count': _CPU_COUNT
             },
             'memory': {
                 'percent': memory.percent,
-                'total_gb': round(memory.total / (1024**3), 2),
-                'available_gb': round(memory.available / (1024**3), 2),
-                'used_gb': round(memory.used / (1024**3), 2)
+                'total_gb': _MEMORY_TOTAL_GB,
+                'available_gb': int(memory.available * _CENTI_GB) / 100.0,
+                'used_gb': int(memory.used * _CENTI_GB) / 100.0
             },
-            'disk': {
-                'percent': disk.percent,
-                'total_gb': round(disk.total / (1024**3), 2),
-                'free_gb': round(disk.free / (1024**3), 2)
-            },
-            'platform': {
-                'system': platform.system(),
-                'release': platform.release(),
-                'python_version': platform.python_version()
-            }
+            'disk': get_disk_metrics(now),
+            # Shared, never mutated
+            'platform': _PLATFORM
         }
+        _LAST['ts'] = now
+        _LAST['metrics'] = metrics
+        return metrics
     except Exception as e:
         logger.error(f"Error collecting system metrics: {e}")
         return {
@@ -260,10 +403,27 @@ def get_system_metrics() -> dict:
         }
 
 
+def get_disk_metrics(now: float) -> dict:
+    """Root filesystem usage, refreshed at most once per DISK_CACHE_SECONDS."""
+    if _DISK_CACHE['value'] is None or now - _DISK_CACHE['ts'] > _DISK_TTL:
+        disk = psutil.disk_usage('/')
+        _DISK_CACHE['value'] = {
+            'percent': disk.percent,
+            'total_gb': _DISK_TOTAL_GB,
+            'free_gb': int(disk.free * _CENTI_GB) / 100.0
+        }
+        _DISK_CACHE['ts'] = now
+    return _DISK_CACHE['value']
+
+
+@functools.lru_cache(maxsize=1)
 def get_instance_id() -> str:
     """
     Get EC2 instance ID from metadata service.
     Falls back to hostname in non-EC2 environments.
+    
+    The instance ID never changes for the life of the process, so the
+    result (including the hostname fallback) is memoized.
     """
     # First check if we have it cached in environment
     instance_id = os.getenv('INSTANCE_ID')
@@ -272,24 +432,28 @@ def get_instance_id() -> str:
     
     # Try EC2 metadata service (IMDSv2)
     try:
-        import requests
-        
         # Get token first (IMDSv2 requirement)
-        token_response = requests.put(
+        token_response = _IMDS_POOL.request(
+            'PUT',
             'http://169.254.169.254/latest/api/token',
-            headers={'X-aws-ec2-metadata-token-ttl-seconds': '21600'},
-            timeout=1
+            headers={'X-aws-ec2-metadata-token-ttl-seconds': '21600'}
         )
-        token = token_response.text
+        # No retries means error statuses don't raise; check them here so
+        # an error page is never cached as the instance ID
+        if token_response.status != 200:
+            return platform.node()
+        token = token_response.data.decode('utf-8')
         
         # Get instance ID using token
-        id_response = requests.get(
+        id_response = _IMDS_POOL.request(
+            'GET',
             'http://169.254.169.254/latest/meta-data/instance-id',
-            headers={'X-aws-ec2-metadata-token': token},
-            timeout=1
+            headers={'X-aws-ec2-metadata-token': token}
         )
-        return id_response.text
+        if id_response.status != 200:
+            return platform.node()
+        return id_response.data.decode('utf-8')
         
     except Exception:
         # Not on EC2 or metadata service unavailable
-        return platform.node()
\ No newline at end of file
+        return platform.node()
@@ -5,19 +5,78 @@ Handles all interactions with AWS S3 for metrics storage.
 This module demonstrates:
 - boto3 SDK usage
 - Error handling for AWS operations
-- JSON serialization for metrics data
+- JSON serialization for metrics data (orjson)
+- Batching metric writes into gzip-compressed NDJSON objects
 """
 
-import json
+import gzip
+import time
+import uuid
+import atexit
 import logging
-from datetime import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+import orjson
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
+
+from timestamps import iso_timestamp
 
 logger = logging.getLogger(__name__)
 
+# Upper bound in seconds on the delay between retries of failed flushes
+MAX_FLUSH_BACKOFF = 300.0
+
+# Parallel GETs when reading metrics back from S3
+FETCH_WORKERS = 16
+
+# How many hourly partitions get_recent_metrics searches, and how many
+# older partitions it lists in parallel once the current hour is exhausted
+LOOKBACK_HOURS = 24
+LIST_BATCH_HOURS = 3
+
+# Partition path for the current hour, as (epoch_hour, 'dt=YYYY-MM-DD/hour=HH/')
+_HOUR = {'value': (None, '')}
+
+
+def reverse_sort_key(now: float) -> str:
+    """Fixed-width key that sorts lexicographically newest first."""
+    return f"{2**64 - int(now * 1_000_000):020d}"
+
+
+def hour_path(hour: int) -> str:
+    """Partition path 'dt=YYYY-MM-DD/hour=HH/' for an epoch hour."""
+    return time.strftime('dt=%Y-%m-%d/hour=%H/', time.gmtime(hour * 3600))
+
+
+def partition_prefix(metric_name: str, now: float) -> str:
+    """
+    S3 prefix of the hourly partition holding a metric sample.
+    The date/hour part is formatted once per hour and reused.
+    """
+    hour = int(now) // 3600
+    cached_hour, path = _HOUR['value']
+    if hour != cached_hour:
+        path = hour_path(hour)
+        _HOUR['value'] = (hour, path)
+    return f"metrics/name={metric_name}/{path}"
+
+
+def lookback_prefixes(metric_name: str, now: float, hours: int) -> list:
+    """
+    S3 prefixes of the last `hours` hourly partitions, newest first.
+    Bypasses the write path's hour cache so reads don't evict it.
+    """
+    current = int(now) // 3600
+    return [
+        f"metrics/name={metric_name}/{hour_path(current - i)}"
+        for i in range(hours)
+    ]
+
 
 class S3Client:
     """
@@ -27,19 +86,58 @@ class S3Client:
     - IAM Instance Profile (EC2)
     - IAM Role (EKS/ECS)
     - Environment variables (local development)
+    
+    Metrics are buffered in memory and flushed by a background thread as
+    NDJSON shards (one per metric and hour) once batch_size records are
+    queued or flush_interval seconds have passed, instead of one PUT per
+    data point. Records from failed uploads are re-queued, up to
+    max_buffered records in total, and retried with exponential backoff.
     """
     
-    def __init__(self, bucket_name: str, region: str = 'us-east-1'):
+    def __init__(self, bucket_name: str, region: str = 'us-east-1',
+                 batch_size: int = 128, flush_interval: float = 5.0,
+                 max_pool_connections: int = 50, max_buffered: int = 10000):
         self.bucket_name = bucket_name
         self.region = region
+        self.max_pool_connections = max_pool_connections
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
         self._client = None
         
+        self._buffer = deque()
+        self._buffer_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flusher = None
+        self._last_flush = time.monotonic()
+        
+        # Backoff after failed flushes: no flush is triggered before
+        # _retry_at; the delay doubles per failure up to MAX_FLUSH_BACKOFF
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        
+        # Shared by all requests so concurrent reads don't each spawn a pool
+        self._executor = ThreadPoolExecutor(
+            max_workers=FETCH_WORKERS,
+            thread_name_prefix='s3-fetch'
+        )
+        
     @property
     def client(self):
-        """Lazy initialization of boto3 client."""
+        """Lazy initialization of boto3 client, shared across requests."""
         if self._client is None:
+            # Larger pool for concurrent workers, adaptive retries and
+            # short timeouts so transient errors don't stall health probes
+            config = Config(
+                region_name=self.region,
+                max_pool_connections=self.max_pool_connections,
+                retries={'max_attempts': 3, 'mode': 'adaptive'},
+                connect_timeout=2,
+                read_timeout=5,
+                tcp_keepalive=True
+            )
             try:
-                self._client = boto3.client('s3', region_name=self.region)
+                self._client = boto3.client('s3', use_ssl=True, config=config)
                 logger.info(f"S3 client initialized for region: {self.region}")
             except NoCredentialsError:
                 logger.warning("AWS credentials not found. S3 operations will fail.")
@@ -48,7 +146,7 @@ class S3Client:
     
     def store_metric(self, metric_name: str, value: float, metadata: Optional[dict] = None) -> dict:
         """
-        Store a metric data point in S3.
+        Queue a metric data point for batched upload to S3.
         
         Args:
             metric_name: Name of the metric (e.g., 'cpu_usage', 'request_count')
@@ -56,58 +154,216 @@ class S3Client:
             metadata: Optional additional context
             
         Returns:
-            dict with success status and storage location
+            dict with success status and the buffered metric; 'invalid' is
+            set when the metric can't be serialized
         """
-        timestamp = datetime.utcnow()
+        now = time.time()
         
         # Create structured metric object
         metric_data = {
             'metric_name': metric_name,
             'value': value,
-            'timestamp': timestamp.isoformat(),
+            'timestamp': iso_timestamp(now, micros=True),
             'metadata': metadata or {}
         }
         
-        # S3 key pattern: metrics/YYYY/MM/DD/metric_name/timestamp.json
-        # This pattern enables efficient time-based queries
-        s3_key = (
-            f"metrics/{timestamp.year}/{timestamp.month:02d}/{timestamp.day:02d}/"
-            f"{metric_name}/{timestamp.strftime('%H%M%S%f')}.json"
-        )
-        
+        # Serialize now so a record orjson can't encode (e.g. ints beyond
+        # 64 bits in metadata) is rejected here instead of breaking a flush.
+        # 'invalid' marks it as the caller's fault rather than a storage error
         try:
-            if self.client is None:
-                return {
-                    'success': False,
-                    'error': 'S3 client not available (check AWS credentials)',
-                    'metric': metric_data
-                }
-            
-            self.client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=json.dumps(metric_data),
-                ContentType='application/json'
-            )
-            
-            logger.info(f"Metric stored: {metric_name}={value} at s3://{self.bucket_name}/{s3_key}")
-            
+            line = orjson.dumps(metric_data)
+        except orjson.JSONEncodeError as e:
+            logger.warning(f"Cannot serialize metric {metric_name}: {e}")
+            return {
+                'success': False,
+                'invalid': True,
+                'error': f"Metric is not JSON-serializable: {e}",
+                'metric_name': metric_name
+            }
+        
+        if self.client is None:
             return {
-                'success': True,
-                'location': f"s3://{self.bucket_name}/{s3_key}",
+                'success': False,
+                'error': 'S3 client not available (check AWS credentials)',
                 'metric': metric_data
             }
-            
-        except ClientError as e:
-            error_code = e.response['Error']['Code']
-            error_msg = e.response['Error']['Message']
-            logger.error(f"S3 error storing metric: {error_code} - {error_msg}")
-            
+        
+        with self._buffer_lock:
+            buffered = len(self._buffer)
+            if buffered < self.max_buffered:
+                self._buffer.append((partition_prefix(metric_name, now), line))
+                buffered += 1
+            else:
+                buffered = None
+        
+        if buffered is None:
+            logger.error(f"Metric buffer full, rejecting {metric_name}")
+            self._flush_event.set()
             return {
                 'success': False,
-                'error': f"{error_code}: {error_msg}",
+                'error': 'Metric buffer full (S3 uploads are failing or behind)',
                 'metric': metric_data
             }
+        
+        self._ensure_flusher()
+        if buffered >= self.batch_size and time.monotonic() >= self._retry_at:
+            self._flush_event.set()
+        
+        return {
+            'success': True,
+            'buffered': True,
+            'metric': metric_data
+        }
+    
+    def flush(self) -> dict:
+        """
+        Upload all buffered metrics to S3 as gzip-compressed NDJSON shards,
+        one object per metric and hour.
+        
+        Returns:
+            dict with success status, record count and storage locations
+        """
+        with self._buffer_lock:
+            batch = list(self._buffer)
+            self._buffer.clear()
+            self._last_flush = time.monotonic()
+        
+        if not batch:
+            return {'success': True, 'count': 0, 'locations': []}
+        
+        if self.client is None:
+            logger.error(f"S3 client not available, re-queueing {len(batch)} metrics")
+            self._requeue(batch)
+            self._update_backoff(failed=True)
+            return {
+                'success': False,
+                'error': 'S3 client not available (check AWS credentials)',
+                'count': len(batch)
+            }
+        
+        flushed_at = time.time()
+        shards = {}
+        for prefix, line in batch:
+            shards.setdefault(prefix, []).append(line)
+        
+        locations = []
+        errors = []
+        failed = []
+        for prefix, lines in shards.items():
+            # S3 key pattern: metrics/name=<metric>/dt=YYYY-MM-DD/hour=HH/part-<rev_ts>-<uuid>.ndjson
+            # Partitioning by metric and hour lets reads list only what they need,
+            # and the reversed timestamp makes S3 list the newest shard first
+            s3_key = f"{prefix}part-{reverse_sort_key(flushed_at)}-{uuid.uuid4().hex}.ndjson"
+            # Level 1 gets most of the ratio on repetitive JSON for little CPU
+            body = gzip.compress(
+                b'\n'.join(lines),
+                compresslevel=1
+            )
+            
+            try:
+                self.client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=body,
+                    ContentType='application/x-ndjson',
+                    ContentEncoding='gzip'
+                )
+                locations.append(f"s3://{self.bucket_name}/{s3_key}")
+                
+            except ClientError as e:
+                error_code = e.response['Error']['Code']
+                error_msg = e.response['Error']['Message']
+                logger.error(f"S3 error flushing {len(lines)} metrics: {error_code} - {error_msg}")
+                errors.append(f"{error_code}: {error_msg}")
+                failed.extend((prefix, line) for line in lines)
+            
+            except BotoCoreError as e:
+                # e.g. missing credentials, endpoint or connection errors
+                logger.error(f"S3 error flushing {len(lines)} metrics: {e}")
+                errors.append(str(e))
+                failed.extend((prefix, line) for line in lines)
+        
+        if failed:
+            self._requeue(failed)
+        self._update_backoff(failed=bool(failed))
+        
+        logger.info(f"Flushed {len(batch)} metrics to {len(locations)} objects in s3://{self.bucket_name}")
+        
+        result = {
+            'success': not errors,
+            'count': len(batch),
+            'locations': locations
+        }
+        if errors:
+            result['error'] = '; '.join(errors)
+            result['requeued'] = len(failed)
+        return result
+    
+    def _update_backoff(self, failed: bool):
+        """Back off after a failed flush; reset after a successful one."""
+        with self._buffer_lock:
+            if failed:
+                self._backoff = min(
+                    max(self._backoff * 2, self.flush_interval),
+                    MAX_FLUSH_BACKOFF
+                )
+                self._retry_at = time.monotonic() + self._backoff
+            else:
+                self._backoff = 0.0
+                self._retry_at = 0.0
+        
+        if failed:
+            logger.warning(f"Metric flush failed, next attempt in {self._backoff:.1f}s")
+    
+    def _requeue(self, items: list):
+        """
+        Put records from a failed flush back at the front of the buffer.
+        If that exceeds max_buffered, the oldest records are dropped.
+        """
+        with self._buffer_lock:
+            self._buffer.extendleft(reversed(items))
+            overflow = len(self._buffer) - self.max_buffered
+            for _ in range(max(overflow, 0)):
+                self._buffer.popleft()
+        
+        if overflow > 0:
+            logger.error(f"Metric buffer full, dropped {overflow} oldest metrics")
+    
+    def _ensure_flusher(self):
+        """Start the background flush thread on first use."""
+        if self._flusher is not None:
+            return
+        with self._buffer_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop,
+                    name='s3-metrics-flusher',
+                    daemon=True
+                )
+                self._flusher.start()
+                atexit.register(self.flush)
+    
+    def _flush_loop(self):
+        """Flush when the batch is full or the flush interval has elapsed."""
+        while True:
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            
+            now = time.monotonic()
+            with self._buffer_lock:
+                pending = len(self._buffer)
+                elapsed = now - self._last_flush
+                backing_off = now < self._retry_at
+            
+            # Don't hammer S3 while it is failing or throttling us
+            if backing_off:
+                continue
+            
+            if pending >= self.batch_size or (pending and elapsed >= self.flush_interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Error flushing metrics: {e}")
     
     def get_recent_metrics(self, metric_name: str, limit: int = 10) -> list:
         """
@@ -120,34 +376,49 @@ class S3Client:
         Returns:
             List of metric objects, most recent first
         """
-        today = datetime.utcnow()
-        prefix = f"metrics/{today.year}/{today.month:02d}/{today.day:02d}/{metric_name}/"
+        if limit <= 0:
+            return []
+        
+        now = time.time()
         
         try:
             if self.client is None:
                 logger.warning("S3 client not available")
                 return []
             
-            response = self.client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix,
-                MaxKeys=limit
-            )
-            
+            # Walk partitions newest first: the current hour on its own, then
+            # older hours a few at a time (listed in parallel), only while
+            # more records are still needed
+            prefixes = lookback_prefixes(metric_name, now, LOOKBACK_HOURS)
             metrics = []
-            for obj in response.get('Contents', []):
-                try:
-                    result = self.client.get_object(
-                        Bucket=self.bucket_name,
-                        Key=obj['Key']
-                    )
-                    metric_data = json.loads(result['Body'].read().decode('utf-8'))
-                    metrics.append(metric_data)
-                except Exception as e:
-                    logger.error(f"Error reading metric {obj['Key']}: {e}")
-                    continue
+            start, batch = 0, 1
+            while start < len(prefixes) and len(metrics) < limit:
+                window = prefixes[start:start + batch]
+                first_pages = list(self._executor.map(self._list_shards, window))
+                
+                for prefix, page in zip(window, first_pages):
+                    while page is not None:
+                        # Shard keys sort newest first, so each page of the
+                        # listing is the next most recent set of shards
+                        keys = [obj['Key'] for obj in page.get('Contents', [])]
+                        
+                        # Fetch shards in parallel (boto3 clients are thread-safe)
+                        for records in self._executor.map(self._fetch_key, keys):
+                            if records is not None:
+                                metrics.extend(records)
+                        
+                        if len(metrics) >= limit or not page.get('IsTruncated'):
+                            break
+                        page = self._list_shards(prefix, page['NextContinuationToken'])
+                    
+                    if len(metrics) >= limit:
+                        break
+                
+                start += batch
+                batch = LIST_BATCH_HOURS
             
-            # Sort by timestamp descending
+            # Shards from different workers can overlap in time, so order
+            # the (small) collected set by timestamp descending
             metrics.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
             
             return metrics[:limit]
@@ -156,6 +427,40 @@ class S3Client:
             logger.error(f"S3 error retrieving metrics: {e}")
             return []
     
+    def _list_shards(self, prefix: str, token: Optional[str] = None) -> Optional[dict]:
+        """
+        List one page of shard keys under a partition prefix, or None on
+        error so one bad partition doesn't discard what was already read.
+        """
+        kwargs = {
+            'Bucket': self.bucket_name,
+            'Prefix': prefix,
+            'MaxKeys': FETCH_WORKERS
+        }
+        if token:
+            kwargs['ContinuationToken'] = token
+        try:
+            return self.client.list_objects_v2(**kwargs)
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"S3 error listing {prefix}: {e}")
+            return None
+    
+    def _fetch_key(self, key: str) -> Optional[list]:
+        """Download one metrics shard and parse its records, or None on error."""
+        try:
+            result = self.client.get_object(
+                Bucket=self.bucket_name,
+                Key=key
+            )
+            body = result['Body'].read()
+            if result.get('ContentEncoding') == 'gzip':
+                body = gzip.decompress(body)
+            # orjson parses bytes directly, no intermediate str
+            return [orjson.loads(line) for line in body.splitlines()]
+        except Exception as e:
+            logger.error(f"Error reading metrics shard {key}: {e}")
+            return None
+    
     def check_bucket_access(self) -> dict:
         """
         Verify S3 bucket exists and is accessible.
@@ -0,0 +1,28 @@
+"""
+Timestamps Module
+Cached ISO 8601 UTC timestamp formatting shared by routes and S3 storage.
+"""
+
+import time
+
+# ISO timestamp for the current second, as (epoch_second, 'YYYY-MM-DDTHH:MM:SS')
+_TS = {'value': (0, '')}
+
+
+def iso_timestamp(now: float, micros: bool = False) -> str:
+    """
+    Format an epoch time as an ISO 8601 UTC string ending in 'Z'.
+    The seconds part is formatted once per second and reused.
+    
+    Args:
+        now: Epoch time, e.g. from time.time()
+        micros: Append microseconds (for stored metrics)
+    """
+    sec = int(now)
+    cached_sec, iso = _TS['value']
+    if sec != cached_sec:
+        iso = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(sec))
+        _TS['value'] = (sec, iso)
+    if micros:
+        return f"{iso}.{int((now - sec) * 1_000_000):06d}Z"
+    return f"{iso}Z"
@@ -518,8 +518,11 @@ WorkingDirectory=${APP_DIR}/app
 EnvironmentFile=${APP_DIR}/.env
 
 # Use Gunicorn for production (4 workers recommended for t3.micro)
+# Threaded workers let requests waiting on S3 overlap within a worker
 ExecStart=/usr/local/bin/gunicorn \
     --workers 2 \
+    --worker-class gthread \
+    --threads 8 \
     --bind 0.0.0.0:5000 \
     --access-logfile /var/log/${APP_NAME}/access.log \
     --error-logfile /var/log/${APP_NAME}/error.log \
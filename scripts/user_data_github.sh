@@ -62,7 +62,7 @@ Type=simple
 User=${APP_USER}
 WorkingDirectory=${APP_DIR}/app
 EnvironmentFile=${APP_DIR}/.env
-ExecStart=/usr/local/bin/gunicorn --workers 2 --bind 0.0.0.0:5000 "main:create_app()"
+ExecStart=/usr/local/bin/gunicorn --workers 2 --worker-class gthread --threads 8 --bind 0.0.0.0:5000 "main:create_app()"
 Restart=always
 RestartSec=5
 